@@ -83,8 +83,27 @@ def test_domain(domain_name):
     
     collection = db[collection_name]
     
-    # Get sample documents
-    sample_docs = list(collection.find().limit(3))
+    important_fields = [
+        'geoid', 'pop', 'food_insecurity_score', 
+        'poverty_rate', 'snap_rate', 'vehicle_access_rate', 'need'
+    ]
+    
+    # Let the server report the BSON type of each field we care about
+    # ("missing" when absent) instead of shipping whole documents back
+    sample_docs = list(collection.aggregate([
+        {"$limit": 3},
+        {"$project": {
+            "_id": 0,
+            "geometry": {"$type": "$geometry"},
+            "properties": {"$type": "$properties"},
+            "geometry_type": "$geometry.type",
+            "coordinates": {"$type": "$geometry.coordinates"},
+            "sample_coordinate": {
+                "$arrayElemAt": [{"$arrayElemAt": ["$geometry.coordinates", 0]}, 0]
+            },
+            **{f: {"$type": f"$properties.{f}"} for f in important_fields}
+        }}
+    ]))
     
     print(f"\n📊 Domain: {domain_name}")
     print(f"   Collection: {collection_name}")
@@ -97,35 +116,26 @@ def test_domain(domain_name):
         # Check required fields
         required_fields = ['geometry', 'properties']
         for field in required_fields:
-            if field in doc:
+            if doc[field] != 'missing':
                 print(f"   ✅ Has '{field}' field")
             else:
                 print(f"   ❌ Missing '{field}' field")
         
         # Check properties
-        if 'properties' in doc:
-            props = doc['properties']
+        if doc['properties'] != 'missing':
             print("\n   Properties fields:")
-            important_fields = [
-                'geoid', 'pop', 'food_insecurity_score', 
-                'poverty_rate', 'snap_rate', 'vehicle_access_rate', 'need'
-            ]
             for field in important_fields:
-                if field in props:
-                    value = props[field]
-                    print(f"   ✅ {field}: {value} (type: {type(value).__name__})")
+                if doc[field] != 'missing':
+                    print(f"   ✅ {field}: (type: {doc[field]})")
                 else:
                     print(f"   ⚠️  {field}: NOT FOUND")
         
         # Check geometry
-        if 'geometry' in doc:
-            geom = doc['geometry']
-            if 'type' in geom and 'coordinates' in geom:
-                print(f"\n   ✅ Geometry type: {geom['type']}")
-                if geom['coordinates'] and len(geom['coordinates']) > 0:
-                    coords = geom['coordinates'][0]
-                    if coords and len(coords) > 0:
-                        print(f"   ✅ Sample coordinate: {coords[0]}")
+        if doc['geometry'] != 'missing':
+            if doc.get('geometry_type') and doc['coordinates'] != 'missing':
+                print(f"\n   ✅ Geometry type: {doc['geometry_type']}")
+                if doc.get('sample_coordinate'):
+                    print(f"   ✅ Sample coordinate: {doc['sample_coordinate']}")
             else:
                 print("   ❌ Invalid geometry structure")
 
@@ -188,18 +188,19 @@ Setup and Test Execution Script
     if success:
         logger.info("🚀 Starting food bank optimization test...")
         
+        # Try to run with real data first, in-process so the ADK/vertexai
+        # imports and interpreter startup are not paid a second time
+        logger.info("Attempting to run with real domain data...")
         try:
-            # Try to run with real data first
-            logger.info("Attempting to run with real domain data...")
-            subprocess.check_call([
-                sys.executable, 
-                "test_full_agent_architecture.py", 
-                "--domain", "downtown_la",
-                "--budget", "500000"
-            ])
+            from test_full_agent_architecture import main as tfa_main
+            results = await tfa_main(domain="downtown_la", budget=500000)
+        except Exception as e:
+            logger.error(f"❌ Real data test raised: {e}")
+            results = None
+        
+        if results:
             logger.info("✅ Real data test completed!")
-            
-        except (subprocess.CalledProcessError, FileNotFoundError):
+        else:
             logger.info("⚠️  Real data test failed - running with mock data...")
             
             # Run with mock data
@@ -8,18 +8,45 @@ Fetch California census blocks with ACS demographic data using hybrid approach:
 import os
 import sys
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import aiohttp
+import asyncio
 import geopandas as gpd
 import pandas as pd
 import numpy as np
-from shapely.geometry import shape
-from pymongo import MongoClient, UpdateOne
+import shapely
+from pyproj import Transformer
+from pymongo import MongoClient, IndexModel, ASCENDING, GEOSPHERE
+import bson
+from bson.raw_bson import RawBSONDocument
 from dotenv import load_dotenv
 import time
 from datetime import datetime
 import logging
-from multiprocessing import Pool, cpu_count
-from functools import partial
 import json
+import importlib.util
+import io
+import zipfile
+import hashlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# pyogrio reads shapefiles much faster than fiona, and faster still with Arrow
+try:
+    import pyogrio
+    PYOGRIO_AVAILABLE = True
+except ImportError:
+    PYOGRIO_AVAILABLE = False
+ARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# orjson parses the serialized geometries several times faster than json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # Set up logging
 logging.basicConfig(
@@ -46,8 +73,24 @@ DB_NAME = os.getenv('TEST_DB_NAME', 'food_insecurity_test')
 COLLECTION_NAME = 'census_blocks'
 
 # Processing configuration
-BATCH_SIZE = 1000
-NUM_PROCESSES = min(cpu_count(), 8)
+BATCH_SIZE = 5000
+CENSUS_CONCURRENCY = 8  # Concurrent Census API requests (stays under rate limits)
+COUNTIES_PER_REQUEST = 10  # Counties per Census API call (comma-separated list)
+COUNTIES_PER_BATCH = 10  # Counties per feature build handed to the writer thread
+CENSUS_CACHE_DIR = '.census_cache'  # Parquet copies of Census downloads and API results (needs pyarrow)
+CENSUS_CACHE_MAX_AGE = 30 * 86400  # seconds
+BLOCK_COLUMNS = ['GEOID', 'COUNTYFP']  # Shapefile attributes used downstream
+DOWNLOAD_PARTS = 8  # Parallel HTTP range requests for the shapefile download
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Shared HTTP session so synchronous requests reuse connections and retry
+# transient failures
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
 
 def download_california_blocks():
     """Download California census block groups shapefile from TIGER/Line."""
@@ -60,36 +103,197 @@ def download_california_blocks():
     
     logging.info(f"Downloading California block groups from {url}")
     
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    
-    # Save the file
-    with open(filename, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    head = SESSION.head(url, allow_redirects=True, timeout=30)
+    head.raise_for_status()
+    size = int(head.headers.get('Content-Length', 0))
+    
+    # The zip is kept in memory and extracted from there; it never touches disk
+    if head.headers.get('Accept-Ranges') == 'bytes' and size > DOWNLOAD_PARTS * DOWNLOAD_CHUNK_SIZE:
+        # Fetch byte ranges over parallel connections straight into a
+        # preallocated BytesIO (writing its last byte zero-fills the rest);
+        # each part writes its own slice of the shared view, so no copy is made
+        zip_buffer = io.BytesIO()
+        zip_buffer.seek(size - 1)
+        zip_buffer.write(b'\0')
+        part_size = -(-size // DOWNLOAD_PARTS)
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+        with zip_buffer.getbuffer() as buffer, ThreadPoolExecutor(DOWNLOAD_PARTS) as executor:
+            list(executor.map(lambda r: download_range(url, buffer, *r), ranges))
+    else:
+        response = SESSION.get(url, stream=True, timeout=30)
+        response.raise_for_status()
+        
+        zip_buffer = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            zip_buffer.write(chunk)
     
     logging.info(f"Downloaded {filename}")
     
     # Extract the shapefile
-    import zipfile
-    with zipfile.ZipFile(filename, 'r') as zip_ref:
+    with zipfile.ZipFile(zip_buffer, 'r') as zip_ref:
         zip_ref.extractall('.')
     
     logging.info("Extracted shapefile")
-    os.remove(filename)  # Clean up zip file
     
     return filename.replace('.zip', '.shp')
 
-def fetch_block_group_acs_data(county_fips_list):
+def load_block_groups():
+    """Load California block groups in WGS84 with valid geometries.
+    
+    The prepared GeoDataFrame is cached as GeoParquet (when pyarrow is
+    installed), so reruns skip the download, shapefile parse and reprojection.
+    """
+    cache_path = os.path.join(CENSUS_CACHE_DIR, f"block_groups_2022_{CALIFORNIA_FIPS}.parquet")
+    if ARROW_AVAILABLE and os.path.exists(cache_path):
+        logging.info(f"Loading block groups from {cache_path}")
+        return gpd.read_parquet(cache_path)
+    
+    # Download shapefile
+    shapefile_path = download_california_blocks()
+    
+    # Load shapefile
+    logging.info("Loading shapefile...")
+    if PYOGRIO_AVAILABLE:
+        blocks_gdf = pyogrio.read_dataframe(shapefile_path, columns=BLOCK_COLUMNS,
+                                            use_arrow=ARROW_AVAILABLE)
+    else:
+        blocks_gdf = gpd.read_file(shapefile_path)[BLOCK_COLUMNS + ['geometry']]
+    blocks_gdf = reproject_to_wgs84(blocks_gdf)  # Convert to WGS84
+    
+    # Drop missing or invalid geometries in one vectorized pass; the
+    # 2dsphere index would reject them
+    geometries = blocks_gdf.geometry.values
+    valid = ~shapely.is_missing(geometries) & shapely.is_valid(geometries)
+    if not valid.all():
+        logging.warning(f"Skipping {(~valid).sum()} block groups with missing or invalid geometry")
+        blocks_gdf = blocks_gdf.loc[valid].reset_index(drop=True)
+    
+    if ARROW_AVAILABLE:
+        try:
+            os.makedirs(CENSUS_CACHE_DIR, exist_ok=True)
+            blocks_gdf.to_parquet(cache_path, compression='zstd')
+        except Exception as e:
+            logging.warning(f"Could not cache block groups: {e}")
+    
+    return blocks_gdf
+
+def reproject_to_wgs84(gdf):
+    """Return ``gdf`` in EPSG:4326, transforming all vertices in one PROJ call."""
+    if gdf.crs is not None and gdf.crs.to_epsg() == 4326:
+        return gdf
+    
+    transformer = Transformer.from_crs(gdf.crs, 'EPSG:4326', always_xy=True)
+    
+    def transform_coords(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack((x, y))
+    
+    # shapely.transform flattens every geometry's coordinates into a single
+    # array, so PROJ sees all vertices at once instead of one geometry at a time
+    geometries = shapely.transform(np.asarray(gdf.geometry.values), transform_coords)
+    return gdf.set_geometry(gpd.GeoSeries(geometries, index=gdf.index, crs='EPSG:4326'))
+
+def download_range(url, buffer, start, end):
+    """Download bytes ``start``-``end`` of ``url`` into the same offset of ``buffer``."""
+    response = SESSION.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=30)
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise ValueError(f"Server ignored range request for bytes {start}-{end}")
+    
+    offset = start
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        buffer[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+
+def county_groups(county_fips_list):
+    """Split counties into comma-separated groups for multi-county API calls."""
+    return [
+        ','.join(county_fips_list[i:i + COUNTIES_PER_REQUEST])
+        for i in range(0, len(county_fips_list), COUNTIES_PER_REQUEST)
+    ]
+
+async def fetch_county_rows(session, semaphore, url, params, county_fips, label):
+    """Fetch Census API rows (header dropped) for a county list; None on error."""
+    async with semaphore:
+        try:
+            async with session.get(url, params=params) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            
+            if len(data) > 1:  # Skip if only header row
+                logging.info(f"  Counties {county_fips}: {len(data)-1} {label}")
+                return data[1:]  # Skip header
+            
+        except Exception as e:
+            logging.error(f"Error fetching {label} data for counties {county_fips}: {e}")
+            return None
+    
+    return []
+
+def census_cache_path(name, year, county_fips_list):
+    """Path of the cached Parquet file for a dataset, year and county set."""
+    counties_key = hashlib.md5(','.join(sorted(county_fips_list)).encode()).hexdigest()[:12]
+    return os.path.join(CENSUS_CACHE_DIR, f"{name}_{year}_{CALIFORNIA_FIPS}_{counties_key}.parquet")
+
+def load_census_cache(name, year, county_fips_list):
+    """Return a cached Census DataFrame if one is fresh enough, else None."""
+    if not ARROW_AVAILABLE:
+        return None
+    
+    path = census_cache_path(name, year, county_fips_list)
+    if not os.path.exists(path) or time.time() - os.path.getmtime(path) > CENSUS_CACHE_MAX_AGE:
+        return None
+    
+    logging.info(f"Using cached Census data from {path}")
+    return pd.read_parquet(path)
+
+def save_census_cache(df, name, year, county_fips_list):
+    """Write a fetched Census DataFrame to the Parquet cache."""
+    if not ARROW_AVAILABLE:
+        return
+    
+    try:
+        os.makedirs(CENSUS_CACHE_DIR, exist_ok=True)
+        df.to_parquet(census_cache_path(name, year, county_fips_list), compression='zstd')
+    except Exception as e:
+        logging.warning(f"Could not cache Census data: {e}")
+
+def census_number(value, missing=0.0):
+    """Parse a Census API value as a float, returning ``missing`` if it is absent/non-numeric."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return missing
+
+def census_frame(rows, numeric_cols, text_cols, missing=0.0):
+    """Build a DataFrame from Census API rows whose leading fields are numeric.
+    
+    Numeric columns are parsed straight into one float64 array and the rest
+    are kept as strings, so no object-to-float conversion pass is needed.
+    """
+    n_numeric = len(numeric_cols)
+    numeric = np.array(
+        [[census_number(x, missing) for x in row[:n_numeric]] for row in rows],
+        dtype=np.float64
+    ).reshape(len(rows), n_numeric)
+    
+    columns = {col: numeric[:, k] for k, col in enumerate(numeric_cols)}
+    for k, col in enumerate(text_cols, n_numeric):
+        columns[col] = [row[k] for row in rows]
+    return pd.DataFrame(columns)
+
+async def fetch_block_group_acs_data(session, semaphore, county_fips_list):
     """Fetch ACS data for all block groups in specified counties."""
+    year = "2022"
+    cached = load_census_cache('acs_bg', year, county_fips_list)
+    if cached is not None:
+        return cached
+    
     logging.info(f"Fetching ACS data for {len(county_fips_list)} counties")
     
-    year = "2022"
     dataset = f"{year}/acs/acs5"
     url = f"{CENSUS_API_BASE}/{dataset}"
     
-    all_data = []
-    
     # Variables to fetch at block group level
     variables = [
         'B01003_001E',  # Total population
@@ -103,43 +307,39 @@ def fetch_block_group_acs_data(county_fips_list):
         'NAME'
     ]
     
-    # Fetch data for each county
-    for county_fips in county_fips_list:
-        params = {
+    # Fetch data for all counties concurrently
+    groups = county_groups(county_fips_list)
+    results = await asyncio.gather(*[
+        fetch_county_rows(session, semaphore, url, {
             'get': ','.join(variables),
             'for': 'block group:*',
             'in': f'state:{CALIFORNIA_FIPS} county:{county_fips}',
-            'key': CENSUS_API_KEY
-        }
-        
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if len(data) > 1:  # Skip if only header row
-                all_data.extend(data[1:])  # Skip header
-                logging.info(f"  County {county_fips}: {len(data)-1} block groups")
-            
-        except Exception as e:
-            logging.error(f"Error fetching data for county {county_fips}: {e}")
-            continue
+            # aiohttp rejects None params, so only send a key when one is set
+            **({'key': CENSUS_API_KEY} if CENSUS_API_KEY else {})
+        }, county_fips, "block groups")
+        for county_fips in groups
+    ])
+    failed_groups = [county_fips for county_fips, rows in zip(groups, results) if rows is None]
+    
+    # Append GEOID and tract GEOID to each raw row (state, county, tract and
+    # block group are the last four fields) so no string columns are added
+    all_data = []
+    for rows in results:
+        for row in rows or []:
+            tract_geoid = row[-4] + row[-3] + row[-2]
+            row.append(tract_geoid + row[-1])
+            row.append(tract_geoid)
+            all_data.append(row)
     
     if not all_data:
         raise ValueError("No ACS data fetched")
     
-    # Convert to DataFrame
-    df = pd.DataFrame(all_data, columns=variables + ['state', 'county', 'tract', 'block group'])
-    
-    # Create GEOID
-    df['GEOID'] = df['state'] + df['county'] + df['tract'] + df['block group']
-    df['tract_geoid'] = df['state'] + df['county'] + df['tract']
-    
-    # Convert numeric columns
+    # Convert to DataFrame with numeric columns parsed up front (missing or
+    # non-numeric values become 0)
     numeric_cols = ['B01003_001E', 'C17002_001E', 'C17002_002E', 'C17002_003E', 'B11001_001E', 
                     'B25044_001E', 'B25044_003E', 'B25044_010E']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df = census_frame(all_data, numeric_cols,
+                      ['NAME', 'state', 'county', 'tract', 'block group', 'GEOID', 'tract_geoid'])
     
     # Calculate poverty rate
     df['poverty_rate'] = np.where(
@@ -166,18 +366,25 @@ def fetch_block_group_acs_data(county_fips_list):
     logging.info(f"Average vehicle access rate: {df['vehicle_access_rate'].mean():.3f}")
     logging.info(f"Block groups with <50% vehicle access: {(df['vehicle_access_rate'] < 0.5).sum()}")
     
+    # Never cache a partial result: a retry should fetch the missing counties
+    if failed_groups:
+        logging.error(f"ACS data missing for counties {'; '.join(failed_groups)}; not caching results")
+    else:
+        save_census_cache(df, 'acs_bg', year, county_fips_list)
     return df
 
-def fetch_tract_snap_data(county_fips_list):
+async def fetch_tract_snap_data(session, semaphore, county_fips_list):
     """Fetch SNAP data at tract level for specified counties."""
+    year = "2022"
+    cached = load_census_cache('snap_tract', year, county_fips_list)
+    if cached is not None:
+        return cached
+    
     logging.info(f"Fetching tract-level SNAP data for {len(county_fips_list)} counties")
     
-    year = "2022"
     dataset = f"{year}/acs/acs5"
     url = f"{CENSUS_API_BASE}/{dataset}"
     
-    all_data = []
-    
     # Variables to fetch at tract level
     variables = [
         'B22001_001E',  # Total households (for SNAP)
@@ -185,42 +392,33 @@ def fetch_tract_snap_data(county_fips_list):
         'NAME'
     ]
     
-    # Fetch data for each county
-    for county_fips in county_fips_list:
-        params = {
+    # Fetch data for all counties concurrently
+    groups = county_groups(county_fips_list)
+    results = await asyncio.gather(*[
+        fetch_county_rows(session, semaphore, url, {
             'get': ','.join(variables),
             'for': 'tract:*',
             'in': f'state:{CALIFORNIA_FIPS} county:{county_fips}',
-            'key': CENSUS_API_KEY
-        }
-        
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if len(data) > 1:
-                all_data.extend(data[1:])
-                logging.info(f"  County {county_fips}: {len(data)-1} tracts")
-            
-        except Exception as e:
-            logging.error(f"Error fetching SNAP data for county {county_fips}: {e}")
-            continue
+            # aiohttp rejects None params, so only send a key when one is set
+            **({'key': CENSUS_API_KEY} if CENSUS_API_KEY else {})
+        }, county_fips, "tracts")
+        for county_fips in groups
+    ])
+    failed_groups = [county_fips for county_fips, rows in zip(groups, results) if rows is None]
+    all_data = [row for rows in results if rows for row in rows]
     
     if not all_data:
         logging.warning("No tract SNAP data fetched")
         return pd.DataFrame()
     
-    # Convert to DataFrame
-    df = pd.DataFrame(all_data, columns=variables + ['state', 'county', 'tract'])
+    # Convert to DataFrame with numeric columns parsed up front (missing
+    # values become NaN)
+    df = census_frame(all_data, ['B22001_001E', 'B22001_002E'],
+                      ['NAME', 'state', 'county', 'tract'], missing=np.nan)
     
     # Create tract GEOID
     df['tract_geoid'] = df['state'] + df['county'] + df['tract']
     
-    # Convert numeric columns
-    df['B22001_001E'] = pd.to_numeric(df['B22001_001E'], errors='coerce')
-    df['B22001_002E'] = pd.to_numeric(df['B22001_002E'], errors='coerce')
-    
     # Calculate SNAP rate and total households
     df['tract_snap_rate'] = np.where(
         df['B22001_001E'] > 0,
@@ -232,39 +430,49 @@ def fetch_tract_snap_data(county_fips_list):
     logging.info(f"Total tracts with SNAP data: {len(df)}")
     logging.info(f"Tracts with valid SNAP rates: {(df['tract_snap_rate'] > 0).sum()}")
     
+    # Never cache a partial result: a retry should fetch the missing counties
+    if failed_groups:
+        logging.error(f"SNAP data missing for counties {'; '.join(failed_groups)}; not caching results")
+    else:
+        save_census_cache(df, 'snap_tract', year, county_fips_list)
     return df
 
+async def fetch_census_data(county_fips_list):
+    """Fetch block group ACS and tract SNAP data, overlapping both request sets."""
+    semaphore = asyncio.Semaphore(CENSUS_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=CENSUS_CONCURRENCY)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(
+            fetch_block_group_acs_data(session, semaphore, county_fips_list),
+            fetch_tract_snap_data(session, semaphore, county_fips_list)
+        )
+
 def distribute_snap_to_blocks(block_df, tract_df):
     """Distribute tract-level SNAP to blocks based on poverty-weighted households."""
     logging.info("Distributing SNAP data from tracts to block groups")
     
-    # Merge tract SNAP data with block data
-    merged = block_df.merge(
-        tract_df[['tract_geoid', 'tract_snap_rate', 'tract_snap_households']], 
-        on='tract_geoid', 
-        how='left'
-    )
-    
-    # Fill missing SNAP data with 0
-    merged['tract_snap_rate'] = merged['tract_snap_rate'].fillna(0)
-    merged['tract_snap_households'] = merged['tract_snap_households'].fillna(0)
+    # Look up each block's tract SNAP data (many-to-one, so map against the
+    # tract-indexed frame rather than merging); missing SNAP data becomes 0
+    tract_idx = tract_df.set_index('tract_geoid')
+    merged = block_df.copy()
+    merged['tract_snap_rate'] = merged['tract_geoid'].map(tract_idx['tract_snap_rate']).fillna(0)
+    merged['tract_snap_households'] = merged['tract_geoid'].map(tract_idx['tract_snap_households']).fillna(0)
     
     # Calculate poverty-weighted households for each block
     merged['poverty_weighted_households'] = merged['poverty_rate'] * merged['B11001_001E']
     
-    # Calculate tract totals for poverty-weighted households
-    tract_totals = merged.groupby('tract_geoid')['poverty_weighted_households'].sum().reset_index()
-    tract_totals.columns = ['tract_geoid', 'tract_total_weighted_hh']
-    
-    # Merge back to get tract totals
-    merged = merged.merge(tract_totals, on='tract_geoid', how='left')
+    # Calculate tract totals for poverty-weighted households: sum per
+    # factorized tract code and broadcast back to the rows in one pass
+    tract_codes, _ = pd.factorize(merged['tract_geoid'].to_numpy())
+    weighted_hh = merged['poverty_weighted_households'].to_numpy(dtype=np.float64)
+    merged['tract_total_weighted_hh'] = np.bincount(tract_codes, weights=weighted_hh)[tract_codes]
     
     # Calculate block's share of tract SNAP households
     # Handle division by zero - if no poverty variation, distribute equally
     merged['block_snap_share'] = np.where(
         merged['tract_total_weighted_hh'] > 0,
         merged['poverty_weighted_households'] / merged['tract_total_weighted_hh'],
-        1.0 / merged.groupby('tract_geoid')['GEOID'].transform('count')
+        1.0 / np.bincount(tract_codes)[tract_codes]
     )
     
     # Calculate block SNAP households
@@ -286,54 +494,59 @@ def distribute_snap_to_blocks(block_df, tract_df):
 
 def process_county_batch(county_batch, blocks_gdf, acs_df, tract_snap_df):
     """Process a batch of counties."""
-    batch_features = []
-    
-    for _, block in blocks_gdf[blocks_gdf['COUNTYFP'].isin(county_batch)].iterrows():
-        geoid = block['GEOID']
-        
-        # Get demographic data
-        pop = 0
-        poverty_rate = 0.0
-        snap_rate = 0.0
-        vehicle_access_rate = 0.0
-        households_no_vehicle = 0
-        total_households_vehicle = 0
-        block_group_geoid = geoid  # Block group GEOID is the same as GEOID in this case
-        
-        if geoid in acs_df.index:
-            acs_data = acs_df.loc[geoid]
-            pop = int(acs_data.get('B01003_001E', 0))
-            poverty_rate = float(acs_data.get('poverty_rate', 0))
-            snap_rate = float(acs_data.get('snap_rate', 0))
-            vehicle_access_rate = float(acs_data.get('vehicle_access_rate', 0))
-            households_no_vehicle = int(acs_data.get('households_no_vehicle', 0))
-            total_households_vehicle = int(acs_data.get('total_households_vehicle', 0))
-        
-        # Calculate food insecurity score (improved weighted equation)
-        # Uses poverty, SNAP, and vehicle access with proper weighting
-        
-        # Economic hardship component (70% of score)
-        # Use max of poverty or SNAP rate (whichever is higher indicates more need)
-        economic_hardship = max(poverty_rate, snap_rate)
-        
-        # Transportation barrier component (30% of score)
-        # Convert vehicle access to barrier (1 - access_rate)
-        # If no vehicle access data, assume moderate barrier (0.2)
-        vehicle_barrier = 1 - vehicle_access_rate if vehicle_access_rate > 0 else 0.2
-        
-        # Weighted combination
-        food_insecurity_score = (
-            0.7 * economic_hardship +      # 70% economic factors
-            0.3 * vehicle_barrier          # 30% transportation access
-        ) * 10  # Scale to 0-10
-        
-        # Calculate need (population × score)
-        need = pop * food_insecurity_score if pop > 0 else 0
-        
-        # Create GeoJSON feature
-        feature = {
+    sub = blocks_gdf.loc[blocks_gdf['COUNTYFP'].isin(county_batch), ['GEOID', 'geometry']]
+    
+    # Look up each block's ACS row position through the GEOID index once and
+    # gather the demographic columns from a single 2-D array; blocks without
+    # ACS data get zeros
+    acs_cols = ['B01003_001E', 'poverty_rate', 'snap_rate', 'vehicle_access_rate',
+                'households_no_vehicle', 'total_households_vehicle']
+    rows = acs_df.index.get_indexer(sub['GEOID'])
+    found = rows >= 0
+    acs_values = np.zeros((len(rows), len(acs_cols)), dtype=np.float64)
+    acs_values[found] = acs_df[acs_cols].to_numpy(dtype=np.float64)[rows[found]]
+    acs_values = np.nan_to_num(acs_values)
+    
+    pops = acs_values[:, 0].astype(np.int64)
+    poverty_rates = acs_values[:, 1]
+    snap_rates = acs_values[:, 2]
+    vehicle_access_rates = acs_values[:, 3]
+    
+    # Calculate food insecurity score (improved weighted equation)
+    # Uses poverty, SNAP, and vehicle access with proper weighting
+    
+    # Economic hardship component (70% of score)
+    # Use max of poverty or SNAP rate (whichever is higher indicates more need)
+    economic_hardship = np.maximum(poverty_rates, snap_rates)
+    
+    # Transportation barrier component (30% of score)
+    # Convert vehicle access to barrier (1 - access_rate)
+    # If no vehicle access data, assume moderate barrier (0.2)
+    vehicle_barrier = np.where(vehicle_access_rates > 0, 1 - vehicle_access_rates, 0.2)
+    
+    # Weighted combination
+    food_insecurity_scores = (
+        0.7 * economic_hardship +      # 70% economic factors
+        0.3 * vehicle_barrier          # 30% transportation access
+    ) * 10  # Scale to 0-10
+    
+    # Calculate need (population × score)
+    needs = np.where(pops > 0, pops * food_insecurity_scores, 0)
+    
+    # Serialize all geometries in Shapely's C GeoJSON writer and parse them
+    # back as one JSON array (a single orjson call when available) instead of
+    # walking __geo_interface__ tuples in Python
+    loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+    geometries = loads('[' + ','.join(shapely.to_geojson(sub.geometry.values)) + ']')
+    
+    calculated_at = datetime.utcnow().isoformat()
+    
+    # Create GeoJSON features (block group GEOID is the same as GEOID here);
+    # tolist() hands MongoDB native Python numbers
+    return [
+        {
             "type": "Feature",
-            "geometry": block.geometry.__geo_interface__,
+            "geometry": geometry,
             "properties": {
                 "geoid": geoid,
                 "pop": pop,
@@ -342,47 +555,79 @@ def process_county_batch(county_batch, blocks_gdf, acs_df, tract_snap_df):
                 "vehicle_access_rate": vehicle_access_rate,
                 "households_no_vehicle": households_no_vehicle,
                 "total_households": total_households_vehicle,
-                "block_group_geoid": block_group_geoid,
+                "block_group_geoid": geoid,
                 "food_insecurity_score": food_insecurity_score,
                 "need": need,
-                "score_calculated_at": datetime.utcnow().isoformat(),
+                "score_calculated_at": calculated_at,
                 "score_factors": {
                     "poverty_rate": poverty_rate,
                     "snap_rate": snap_rate,
-                    "economic_hardship": economic_hardship,
+                    "economic_hardship": hardship,
                     "vehicle_access_rate": vehicle_access_rate,
-                    "vehicle_barrier": vehicle_barrier
+                    "vehicle_barrier": barrier
                 }
             }
         }
+        for (geometry, geoid, pop, poverty_rate, snap_rate, vehicle_access_rate,
+             households_no_vehicle, total_households_vehicle, hardship, barrier,
+             food_insecurity_score, need) in zip(
+            geometries,
+            sub['GEOID'].tolist(),
+            pops.tolist(),
+            poverty_rates.tolist(),
+            snap_rates.tolist(),
+            vehicle_access_rates.tolist(),
+            acs_values[:, 4].astype(np.int64).tolist(),
+            acs_values[:, 5].astype(np.int64).tolist(),
+            economic_hardship.tolist(),
+            vehicle_barrier.tolist(),
+            food_insecurity_scores.tolist(),
+            needs.tolist()
+        )
+    ]
+
+def write_features(collection, write_queue, errors, total):
+    """Insert feature batches from ``write_queue`` until a ``None`` sentinel arrives.
+    
+    Progress is logged after every batch against ``total`` expected features.
+    
+    The first failure is appended to ``errors``; later batches are drained
+    without writing so the producer never blocks on a full queue.
+    """
+    written = 0
+    batch_num = 0
+    while (batch := write_queue.get()) is not None:
+        if errors:
+            continue
+        
+        # Insert in unordered batches (writes are independent); the collection
+        # was cleared, so plain inserts are enough
+        try:
+            collection.insert_many(batch, ordered=False, bypass_document_validation=True)
+        except Exception as e:
+            errors.append(e)
+            continue
         
-        batch_features.append(feature)
+        batch_num += 1
+        written += len(batch)
+        logging.info(f"  Inserted batch {batch_num} ({written}/{total} features)")
     
-    return batch_features
+    logging.info(f"  Writer finished: {written} features inserted")
 
 def main():
     """Main processing function."""
     start_time = time.time()
     
     try:
-        # Download shapefile
-        shapefile_path = download_california_blocks()
-        
-        # Load shapefile
-        logging.info("Loading shapefile...")
-        blocks_gdf = gpd.read_file(shapefile_path)
-        blocks_gdf = blocks_gdf.to_crs('EPSG:4326')  # Convert to WGS84
+        blocks_gdf = load_block_groups()
         logging.info(f"Loaded {len(blocks_gdf)} block groups")
         
         # Get list of counties
         counties = blocks_gdf['COUNTYFP'].unique().tolist()
         logging.info(f"Found {len(counties)} counties")
         
-        # Fetch ACS data for all counties
-        acs_df = fetch_block_group_acs_data(counties)
-        
-        # Fetch tract-level SNAP data
-        tract_snap_df = fetch_tract_snap_data(counties)
+        # Fetch ACS data and tract-level SNAP data for all counties
+        acs_df, tract_snap_df = asyncio.run(fetch_census_data(counties))
         
         # Distribute SNAP to block groups
         if not tract_snap_df.empty:
@@ -404,45 +649,46 @@ def main():
         logging.info("Clearing existing data...")
         collection.delete_many({})
         
-        # Process in batches using multiprocessing
-        logging.info(f"Processing blocks using {NUM_PROCESSES} processes...")
-        
-        # Split counties into batches for multiprocessing
-        county_batches = [counties[i:i+10] for i in range(0, len(counties), 10)]
+        # Build features a group of counties at a time (vectorized, in this
+        # process) while a background thread inserts finished batches. Each
+        # batch is encoded to BSON up front so the driver sends it as-is
+        logging.info("Processing blocks and inserting features into MongoDB...")
+        write_queue = queue.Queue(maxsize=4)
+        write_errors = []
+        writer = threading.Thread(target=write_features, args=(collection, write_queue, write_errors, len(blocks_gdf)))
+        writer.start()
         
-        # Create partial function with shared data
-        process_func = partial(process_county_batch, 
-                              blocks_gdf=blocks_gdf, 
-                              acs_df=acs_df,
-                              tract_snap_df=tract_snap_df)
-        
-        all_features = []
-        with Pool(NUM_PROCESSES) as pool:
-            results = pool.map(process_func, county_batches)
-            for batch_features in results:
-                all_features.extend(batch_features)
+        total_features = 0
+        try:
+            for i in range(0, len(counties), COUNTIES_PER_BATCH):
+                features = process_county_batch(counties[i:i+COUNTIES_PER_BATCH], blocks_gdf, acs_df, tract_snap_df)
+                for j in range(0, len(features), BATCH_SIZE):
+                    write_queue.put([RawBSONDocument(bson.encode(f)) for f in features[j:j+BATCH_SIZE]])
+                total_features += len(features)
+        finally:
+            write_queue.put(None)
+            writer.join()
         
-        # Insert into MongoDB in batches
-        logging.info(f"Inserting {len(all_features)} features into MongoDB...")
-        for i in range(0, len(all_features), BATCH_SIZE):
-            batch = all_features[i:i+BATCH_SIZE]
-            collection.insert_many(batch)
-            logging.info(f"  Inserted batch {i//BATCH_SIZE + 1}/{(len(all_features)-1)//BATCH_SIZE + 1}")
+        if write_errors:
+            raise write_errors[0]
+        logging.info(f"Inserted {total_features} features")
         
         # Create indexes
         logging.info("Creating indexes...")
-        collection.create_index("properties.geoid")
-        collection.create_index([("geometry", "2dsphere")])
-        collection.create_index("properties.pop")
-        collection.create_index("properties.poverty_rate")
-        collection.create_index("properties.snap_rate")
-        collection.create_index("properties.vehicle_access_rate")
-        collection.create_index("properties.block_group_geoid")
-        collection.create_index("properties.food_insecurity_score")
-        collection.create_index("properties.need")
+        collection.create_indexes([
+            IndexModel([("properties.geoid", ASCENDING)]),
+            IndexModel([("geometry", GEOSPHERE)]),
+            IndexModel([("properties.pop", ASCENDING)]),
+            IndexModel([("properties.poverty_rate", ASCENDING)]),
+            IndexModel([("properties.snap_rate", ASCENDING)]),
+            IndexModel([("properties.vehicle_access_rate", ASCENDING)]),
+            IndexModel([("properties.block_group_geoid", ASCENDING)]),
+            IndexModel([("properties.food_insecurity_score", ASCENDING)]),
+            IndexModel([("properties.need", ASCENDING)])
+        ])
         
         # Summary statistics
-        total_blocks = collection.count_documents({})
+        total_blocks = collection.estimated_document_count()
         blocks_with_pop = collection.count_documents({"properties.pop": {"$gt": 0}})
         blocks_with_poverty = collection.count_documents({"properties.poverty_rate": {"$gt": 0}})
         blocks_with_snap = collection.count_documents({"properties.snap_rate": {"$gt": 0}})
@@ -8,9 +8,12 @@ import os
 import sys
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
-from pymongo import MongoClient, UpdateOne
+from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime
 from collections import defaultdict
@@ -30,15 +33,17 @@ DB_NAME = os.getenv('TEST_DB_NAME', 'food_insecurity_test')
 CENSUS_API_KEY = os.getenv('CENSUS_API_KEY')
 CENSUS_API_BASE = 'https://api.census.gov/data'
 CALIFORNIA_FIPS = '06'
+CENSUS_FETCH_WORKERS = 16  # Concurrent per-county Census API requests
 
 if not CENSUS_API_KEY:
     raise ValueError("CENSUS_API_KEY environment variable is required")
 
+# One client (and connection pool) shared by every step of the migration
+client = MongoClient(MONGO_URI, maxPoolSize=50, w=1, retryWrites=True)
+db = client[DB_NAME]
+
 def get_collections_to_migrate():
     """Get list of collections that need vehicle access data migration."""
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    
     collections_to_migrate = []
     
     # Check census_blocks collection
@@ -52,25 +57,23 @@ def get_collections_to_migrate():
     
     logging.info(f"Found {len(collections_to_migrate)} collections to migrate:")
     for collection_name in collections_to_migrate:
-        count = db[collection_name].count_documents({})
+        count = db[collection_name].estimated_document_count()
         logging.info(f"  {collection_name}: {count:,} blocks")
     
     return collections_to_migrate
 
 def extract_counties_from_collection(collection):
     """Extract unique counties from census blocks in the collection."""
-    counties = set()
-    
-    # Get unique county codes from block GEOIDs
-    cursor = collection.find({}, {'properties.geoid': 1})
-    
-    for block in cursor:
-        geoid = block.get('properties', {}).get('geoid', '')
-        if len(geoid) >= 5:  # GEOID format: SSCCCTTTTTTBBBB (state+county+tract+block)
-            county_fips = geoid[2:5]  # Extract county FIPS
-            counties.add(county_fips)
-    
-    return list(counties)
+    # Get unique county codes from block GEOIDs on the server
+    # GEOID format: SSCCCTTTTTTBBBB (state+county+tract+block)
+    cursor = collection.aggregate([
+        {'$match': {'properties.geoid': {'$type': 'string'}}},
+        {'$project': {'geoid': '$properties.geoid'}},
+        {'$match': {'$expr': {'$gte': [{'$strLenBytes': '$geoid'}, 5]}}},
+        {'$group': {'_id': {'$substrBytes': ['$geoid', 2, 3]}}}  # County FIPS
+    ])
+    
+    return [doc['_id'] for doc in cursor]
 
 def fetch_vehicle_access_data(county_fips_list):
     """
@@ -97,27 +100,41 @@ def fetch_vehicle_access_data(county_fips_list):
         'NAME'
     ]
     
-    # Fetch data for each county
-    for county_fips in county_fips_list:
+    # One keep-alive session shared by all worker threads, retrying
+    # transient Census API failures
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=CENSUS_FETCH_WORKERS,
+        pool_maxsize=CENSUS_FETCH_WORKERS,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    ))
+    
+    def fetch_county(county_fips):
         params = {
             'get': ','.join(variables),
             'for': 'block group:*',
             'in': f'state:{CALIFORNIA_FIPS} county:{county_fips}',
             'key': CENSUS_API_KEY
         }
-        
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if len(data) > 1:  # Skip if only header row
-                all_data.extend(data[1:])  # Skip header
-                logging.info(f"  County {county_fips}: {len(data)-1} block groups")
-            
-        except Exception as e:
-            logging.error(f"Error fetching vehicle access data for county {county_fips}: {e}")
-            continue
+        response = session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json()
+    
+    # Fetch data for all counties concurrently
+    with session, ThreadPoolExecutor(max_workers=CENSUS_FETCH_WORKERS) as executor:
+        futures = {executor.submit(fetch_county, county_fips): county_fips for county_fips in county_fips_list}
+        for future in as_completed(futures):
+            county_fips = futures[future]
+            try:
+                data = future.result()
+                
+                if len(data) > 1:  # Skip if only header row
+                    all_data.extend(data[1:])  # Skip header
+                    logging.info(f"  County {county_fips}: {len(data)-1} block groups")
+                
+            except Exception as e:
+                logging.error(f"Error fetching vehicle access data for county {county_fips}: {e}")
+                continue
     
     if not all_data:
         raise ValueError("No vehicle access data fetched")
@@ -130,18 +147,20 @@ def fetch_vehicle_access_data(county_fips_list):
     
     # Convert numeric columns
     numeric_cols = ['B25044_001E', 'B25044_003E', 'B25044_010E']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce').fillna(0.0)
     
     # Calculate vehicle access metrics
     df['total_households'] = df['B25044_001E']
     df['households_no_vehicle'] = df['B25044_003E'] + df['B25044_010E']
     
-    # Calculate vehicle access rate (1 - no vehicle rate)
-    df['vehicle_access_rate'] = np.where(
-        df['total_households'] > 0,
-        1 - (df['households_no_vehicle'] / df['total_households']),
-        0  # Default to 0 if no household data
+    # Calculate vehicle access rate (1 - no vehicle rate); default to 0 if
+    # no household data
+    total_households = df['total_households'].to_numpy(dtype=np.float64)
+    df['vehicle_access_rate'] = 1 - np.divide(
+        df['households_no_vehicle'].to_numpy(dtype=np.float64),
+        total_households,
+        out=np.ones(len(df)),
+        where=total_households > 0
     )
     
     # Ensure rate is between 0 and 1
@@ -158,104 +177,107 @@ def migrate_collection(collection_name, vehicle_access_df):
     """
     Migrate a single collection to add vehicle access data.
     """
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
     collection = db[collection_name]
     
     logging.info(f"Migrating collection: {collection_name}")
     
     # Create lookup dictionary for fast access
-    vehicle_lookup = {}
-    for _, row in vehicle_access_df.iterrows():
-        bg_geoid = row['block_group_geoid']
-        vehicle_lookup[bg_geoid] = {
-            'vehicle_access_rate': float(row['vehicle_access_rate']),
-            'households_no_vehicle': int(row['households_no_vehicle']),
-            'total_households': int(row['total_households'])
+    vehicle_lookup = {
+        bg_geoid: {
+            'vehicle_access_rate': vehicle_access_rate,
+            'households_no_vehicle': households_no_vehicle,
+            'total_households': total_households
         }
+        for bg_geoid, vehicle_access_rate, households_no_vehicle, total_households in zip(
+            vehicle_access_df['block_group_geoid'].tolist(),
+            vehicle_access_df['vehicle_access_rate'].to_numpy(dtype=np.float64).tolist(),
+            vehicle_access_df['households_no_vehicle'].to_numpy().astype(np.int64).tolist(),
+            vehicle_access_df['total_households'].to_numpy().astype(np.int64).tolist()
+        )
+    }
     
     logging.info(f"Created lookup for {len(vehicle_lookup)} block groups")
     
     # Process all blocks in the collection
-    total_blocks = collection.count_documents({})
-    logging.info(f"Processing {total_blocks:,} blocks")
-    
-    updates = []
-    blocks_processed = 0
-    blocks_with_vehicle_data = 0
-    blocks_already_have_data = 0
-    batch_size = 1000
-    
-    cursor = collection.find({})
-    
-    for block in cursor:
-        # Check if block already has vehicle access data
-        existing_vehicle_rate = block.get('properties', {}).get('vehicle_access_rate')
-        if existing_vehicle_rate is not None:
-            blocks_already_have_data += 1
-            blocks_processed += 1
-            continue
-            
-        geoid = block.get('properties', {}).get('geoid', '')
-        
-        # Extract block group GEOID from block GEOID
-        # For block groups, the GEOID is already at block group level
-        # For census blocks, we need to truncate to block group level
-        if len(geoid) == 12:
-            # This is already a block group GEOID
-            block_group_geoid = geoid
-        elif len(geoid) >= 12:
-            # This is a census block GEOID, truncate to block group
-            block_group_geoid = geoid[:12]
-        else:
-            block_group_geoid = ''
-        
-        # Default values
-        vehicle_access_rate = 0.0
-        households_no_vehicle = 0
-        total_households = 0
-        
-        # Look up vehicle access data
-        if block_group_geoid in vehicle_lookup:
-            vehicle_data = vehicle_lookup[block_group_geoid]
-            vehicle_access_rate = vehicle_data['vehicle_access_rate']
-            households_no_vehicle = vehicle_data['households_no_vehicle']
-            total_households = vehicle_data['total_households']
-            blocks_with_vehicle_data += 1
-        
-        # Create update
-        update = UpdateOne(
-            {'_id': block['_id']},
-            {
-                '$set': {
-                    'properties.vehicle_access_rate': vehicle_access_rate,
-                    'properties.households_no_vehicle': households_no_vehicle,
-                    'properties.total_households': total_households,
-                    'properties.block_group_geoid': block_group_geoid,
-                    'properties.vehicle_data_updated_at': datetime.utcnow()
-                }
-            }
-        )
-        updates.append(update)
-        blocks_processed += 1
-        
-        # Execute batch updates
-        if len(updates) >= batch_size:
-            collection.bulk_write(updates)
-            logging.info(f"  Processed {blocks_processed:,} blocks...")
-            updates = []
-    
-    # Execute remaining updates
-    if updates:
-        collection.bulk_write(updates)
-    
-    # Create indexes for new fields (if not already existing)
-    logging.info("Creating/updating indexes for vehicle access fields...")
+    logging.info(f"Processing ~{collection.estimated_document_count():,} blocks")
+    
+    # Blocks without vehicle access data (missing or null). Index the field
+    # first so this filter is answered from the index on every pass below
+    # (a sparse index would not cover the missing/null case)
     try:
         collection.create_index("properties.vehicle_access_rate")
-        collection.create_index("properties.block_group_geoid")
     except Exception as e:
-        logging.info(f"Indexes may already exist: {e}")
+        logging.info(f"Index may already exist: {e}")
+    pending = {'properties.vehicle_access_rate': None}
+    total_blocks = collection.count_documents({})
+    blocks_to_update = collection.count_documents(pending)
+    blocks_already_have_data = total_blocks - blocks_to_update
+    blocks_processed = total_blocks
+    
+    # blocks.py writes and indexes block_group_geoid at ingest; derive it
+    # server-side only for older blocks without it. For block groups the
+    # GEOID is already at block group level; census block GEOIDs are
+    # truncated to 12 characters; anything shorter gets ''
+    geoid = {'$ifNull': ['$properties.geoid', '']}
+    collection.update_many({**pending, 'properties.block_group_geoid': None}, [{'$set': {
+        'properties.block_group_geoid': {'$cond': [
+            {'$gte': [{'$strLenBytes': geoid}, 12]},
+            {'$substrBytes': [geoid, 0, 12]},
+            ''
+        ]}
+    }}])
+    collection.create_index("properties.block_group_geoid")
+    logging.info(f"Updating {blocks_to_update:,} blocks without vehicle access data")
+    
+    # Join the vehicle access data onto the blocks inside MongoDB: load it
+    # into a temporary collection and $merge the matched values back
+    updated_at = datetime.utcnow()
+    lookup_collection = db[f"tmp_vehicle_lookup_{collection_name}"]
+    lookup_collection.drop()
+    try:
+        lookup_collection.insert_many(
+            [{'block_group_geoid': bg_geoid, **vehicle_data} for bg_geoid, vehicle_data in vehicle_lookup.items()],
+            ordered=False
+        )
+        lookup_collection.create_index("block_group_geoid")
+        
+        collection.aggregate([
+            {'$match': pending},
+            {'$project': {'_id': 1, 'properties.block_group_geoid': 1}},
+            {'$lookup': {
+                'from': lookup_collection.name,
+                'localField': 'properties.block_group_geoid',
+                'foreignField': 'block_group_geoid',
+                'as': 'vehicle'
+            }},
+            {'$unwind': '$vehicle'},
+            {'$replaceWith': {'_id': '$_id', 'vehicle': '$vehicle'}},
+            {'$merge': {
+                'into': collection_name,
+                'on': '_id',
+                'whenMatched': [{'$set': {
+                    'properties.vehicle_access_rate': '$$new.vehicle.vehicle_access_rate',
+                    'properties.households_no_vehicle': '$$new.vehicle.households_no_vehicle',
+                    'properties.total_households': '$$new.vehicle.total_households',
+                    'properties.vehicle_data_updated_at': updated_at
+                }}],
+                'whenNotMatched': 'discard'
+            }}
+        ], allowDiskUse=True)
+    finally:
+        lookup_collection.drop()
+    
+    blocks_with_vehicle_data = blocks_to_update - collection.count_documents(pending)
+    
+    # Blocks whose block group has no ACS data get default values
+    collection.update_many(pending, {
+        '$set': {
+            'properties.vehicle_access_rate': 0.0,
+            'properties.households_no_vehicle': 0,
+            'properties.total_households': 0,
+            'properties.vehicle_data_updated_at': updated_at
+        }
+    })
     
     # Calculate and log statistics
     coverage_pct = (blocks_with_vehicle_data / (blocks_processed - blocks_already_have_data)) * 100 if (blocks_processed - blocks_already_have_data) > 0 else 0
@@ -291,8 +313,6 @@ def main():
             return
         
         # Get all unique counties from all collections
-        client = MongoClient(MONGO_URI)
-        db = client[DB_NAME]
         all_counties = set()
         
         for collection_name in collections_to_migrate:
@@ -1,24 +1,41 @@
 #!/usr/bin/env python3
 """
-Orchestrator script to run all food insecurity analysis steps sequentially.
-Works with domain collections created by step 1.
+Orchestrator script to run all food insecurity analysis steps.
+Steps declare their dependencies and each one starts as soon as the steps
+it depends on have finished. Works with domain collections created by step 1.
 """
 
 import os
 import sys
-import subprocess
+import asyncio
+import importlib.util
+import re
 from datetime import datetime
-from typing import List, Tuple
+from typing import Any, List, Tuple
 from dotenv import load_dotenv
+from pymongo import MongoClient
 import argparse
 import json
 
 # Load environment variables
 load_dotenv()
 
-# Define the steps in order
+# Patterns used to find the domain collection name in step output
+COLLECTION_NAME_LINE = re.compile(r'Collection name: (.*)')
+DOMAIN_COLLECTION_NAME = re.compile(r'd_[a-zA-Z0-9_]+')
+
+# Directory holding the step scripts
+STEP_SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'step_scripts')
+
+# Maximum number of step scripts running at once
+MAX_PARALLEL_STEPS = 4
+
+# Define the steps in order; 'depends_on' lists the ids of steps that must
+# finish first
 STEPS = [
     {
+        'id': 'create_domain',
+        'depends_on': [],
         'name': 'Create Domain',
         'script': '01_create_domain.py',
         'description': 'Create domain collection from census blocks within radius',
@@ -27,6 +44,8 @@ STEPS = [
     # Note: Score calculation is now done during initial census block collection
     # Domain creation simply copies pre-calculated blocks
     # {
+    #     'id': 'calculate_scores',
+    #     'depends_on': ['create_domain'],
     #     'name': 'Calculate Food Insecurity Scores',
     #     'script': '02_calculate_food_insecurity.py',
     #     'description': 'Calculate initial food insecurity scores based on poverty and SNAP rates',
@@ -34,18 +53,24 @@ STEPS = [
     # },
     # Future steps will be added here:
     # {
+    #     'id': 'find_supermarkets',
+    #     'depends_on': ['create_domain'],
     #     'name': 'Find Nearest Supermarkets',
     #     'script': '04_find_supermarkets.py',
     #     'description': 'Calculate distance to nearest supermarket for each block',
     #     'supports_collection': True
     # },
     # {
+    #     'id': 'update_scores',
+    #     'depends_on': ['find_supermarkets'],
     #     'name': 'Update Food Insecurity Scores',
     #     'script': '05_update_scores.py',
     #     'description': 'Update scores with all factors and calculate need metrics',
     #     'supports_collection': True
     # },
     # {
+    #     'id': 'generate_report',
+    #     'depends_on': ['update_scores'],
     #     'name': 'Generate Analysis Report',
     #     'script': '06_generate_report.py',
     #     'description': 'Generate summary statistics and visualizations',
@@ -53,9 +78,123 @@ STEPS = [
     # }
 ]
 
-def run_step(step_name: str, script_path: str, extra_args: List[str] = None) -> Tuple[bool, str]:
+class DependencyGraph:
+    """Tracks step dependencies and which steps are ready to run."""
+    
+    def __init__(self):
+        self.dependencies = {}
+        self.dependents = {}
+        self.completed = set()
+    
+    def add_task(self, task_id: str, depends_on: List[str] = ()):
+        """Add a task that may only start after every task in ``depends_on``."""
+        self.dependencies.setdefault(task_id, set()).update(depends_on)
+        self.dependents.setdefault(task_id, set())
+        for dep in depends_on:
+            self.dependents.setdefault(dep, set()).add(task_id)
+            self.dependencies.setdefault(dep, set())
+    
+    def get_ready_tasks(self) -> List[str]:
+        """Return tasks whose dependencies have all completed."""
+        return [
+            task_id for task_id, deps in self.dependencies.items()
+            if task_id not in self.completed and deps <= self.completed
+        ]
+    
+    def mark_completed(self, task_id: str) -> List[str]:
+        """Mark a task as completed and return the tasks it unblocked."""
+        self.completed.add(task_id)
+        return [
+            dependent for dependent in self.dependents[task_id]
+            if dependent not in self.completed and self.dependencies[dependent] <= self.completed
+        ]
+    
+    def topological_sort(self) -> List[str]:
+        """Return the tasks in dependency order (Kahn's algorithm)."""
+        in_degree = {task_id: len(deps) for task_id, deps in self.dependencies.items()}
+        queue = [task_id for task_id, degree in in_degree.items() if degree == 0]
+        order = []
+        while queue:
+            task_id = queue.pop(0)
+            order.append(task_id)
+            for dependent in self.dependents[task_id]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+        return order
+    
+    def detect_cycles(self) -> List[str]:
+        """Return the tasks that are part of (or blocked by) a dependency cycle."""
+        ordered = set(self.topological_sort())
+        return [task_id for task_id in self.dependencies if task_id not in ordered]
+
+# Step modules loaded for in-process runs, and the client they share
+_step_modules = {}
+_shared_client = None
+
+def get_shared_client() -> MongoClient:
+    """Return the MongoClient shared by all in-process steps."""
+    global _shared_client
+    if _shared_client is None:
+        # Step 1 already opens a client with its bulk-load settings on import;
+        # share that one rather than opening a second pool
+        create_domain_step = load_step_module(os.path.join(STEP_SCRIPTS_DIR, STEPS[0]['script']))
+        _shared_client = create_domain_step.mongo_client
+    return _shared_client
+
+def load_step_module(script_path: str):
+    """Import a step script once (step file names are not valid module names)."""
+    if script_path not in _step_modules:
+        module_name = os.path.splitext(os.path.basename(script_path))[0]
+        spec = importlib.util.spec_from_file_location(f"step_{module_name}", script_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _step_modules[script_path] = module
+    return _step_modules[script_path]
+
+def print_step_header(step_name: str, script_path: str, extra_args: List[str] = None):
+    """Print the banner shown before a step runs."""
+    print(f"\n{'='*60}")
+    print(f"Running: {step_name}")
+    print(f"Script: {script_path}")
+    print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    if extra_args:
+        print(f"Arguments: {' '.join(extra_args)}")
+    print(f"{'='*60}\n")
+
+async def run_step_inproc(step_name: str, script_path: str, extra_args: List[str] = None) -> Tuple[bool, str, Any]:
+    """
+    Run a single step by calling its ``main`` in this interpreter, on a worker
+    thread so other running steps are not blocked.
+    
+    Args:
+        step_name: Name of the step
+        script_path: Path to the script
+        extra_args: Arguments to pass to the step's ``main``
+        
+    Returns:
+        Tuple of (success, output, value returned by the step)
+    """
+    print_step_header(step_name, script_path, extra_args)
+    
+    try:
+        module = load_step_module(script_path)
+        value = await asyncio.to_thread(module.main, extra_args or [], client=get_shared_client())
+        return True, '', value
+    except SystemExit as e:
+        # argparse errors and explicit sys.exit calls inside the step
+        if not e.code:
+            return True, '', None
+        print(f"\n✗ Step {step_name} exited with code {e.code}")
+        return False, f"Step exited with code {e.code}", None
+    except Exception as e:
+        print(f"\n✗ Step {step_name} failed: {e}")
+        return False, str(e), None
+
+async def run_step(step_name: str, script_path: str, extra_args: List[str] = None) -> Tuple[bool, str, Any]:
     """
-    Run a single step script.
+    Run a single step script in a child process without blocking other
+    running steps.
     
     Args:
         step_name: Name of the step
@@ -63,15 +202,9 @@ def run_step(step_name: str, script_path: str, extra_args: List[str] = None) ->
         extra_args: Additional arguments to pass to the script
         
     Returns:
-        Tuple of (success, output)
+        Tuple of (success, output, collection name found in the output)
     """
-    print(f"\n{'='*60}")
-    print(f"Running: {step_name}")
-    print(f"Script: {script_path}")
-    print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    if extra_args:
-        print(f"Arguments: {' '.join(extra_args)}")
-    print(f"{'='*60}\n")
+    print_step_header(step_name, script_path, extra_args)
     
     try:
         # Build command
@@ -79,48 +212,157 @@ def run_step(step_name: str, script_path: str, extra_args: List[str] = None) ->
         if extra_args:
             cmd.extend(extra_args)
         
-        # Run the script
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
+        # Run the script, echoing its output as it arrives
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=STEP_SCRIPTS_DIR
         )
+        names = {}
+        await asyncio.gather(
+            stream_output(proc.stdout, sys.stdout, names),
+            stream_output(proc.stderr, sys.stderr, names)
+        )
+        await proc.wait()
         
-        # Print output
-        if result.stdout:
-            print(result.stdout)
-        
-        if result.stderr:
-            print("Warnings/Errors:", file=sys.stderr)
-            print(result.stderr, file=sys.stderr)
+        if proc.returncode != 0:
+            print(f"\n✗ Step {step_name} failed with exit code {proc.returncode}")
+            return False, f"Command {cmd} returned non-zero exit status {proc.returncode}", None
         
-        # Return both stdout and stderr for parsing
-        return True, result.stdout + '\n' + result.stderr
+        return True, '', names.get('collection_name') or names.get('domain_name')
         
-    except subprocess.CalledProcessError as e:
-        print(f"\n✗ Step failed with exit code {e.returncode}")
-        if e.stdout:
-            print("Output:")
-            print(e.stdout)
-        if e.stderr:
-            print("Error:")
-            print(e.stderr)
-        return False, str(e)
     except Exception as e:
         print(f"\n✗ Unexpected error: {e}")
-        return False, str(e)
+        return False, str(e), None
 
-def extract_collection_name(output: str) -> str:
-    """Extract collection name from step 1 output."""
-    # Look in both stdout and stderr since logging goes to stderr
-    for line in output.split('\n'):
-        if 'Collection name: ' in line:
-            # Extract the collection name after the colon
-            parts = line.split('Collection name: ')
-            if len(parts) > 1:
-                return parts[1].strip()
-    return None
+async def stream_output(stream, out, names: dict):
+    """
+    Echo a child process stream line by line, recording the collection name
+    in ``names`` once seen (logging goes to stderr, prints to stdout).
+    """
+    async for line in stream:
+        text = line.decode(errors='replace')
+        print(text, end='', file=out)
+        
+        if 'collection_name' in names:
+            continue
+        match = COLLECTION_NAME_LINE.search(text)
+        if match:
+            names['collection_name'] = match.group(1).strip()
+        elif 'domain_name' not in names:
+            # Fall back to the first d_* collection name mentioned
+            match = DOMAIN_COLLECTION_NAME.search(text)
+            if match:
+                names['domain_name'] = match.group(0)
+
+async def run_steps(args, steps_to_run: List[int], collection_name: str, results: List[dict]) -> Tuple[bool, str]:
+    """
+    Run the selected steps, starting each one as soon as the steps it
+    depends on have completed (at most MAX_PARALLEL_STEPS at a time).
+    
+    Returns:
+        Tuple of (all_success, collection_name)
+    """
+    steps = {step['id']: (i, step) for i, step in enumerate(STEPS, 1)}
+    graph = DependencyGraph()
+    for step in STEPS:
+        graph.add_task(step['id'], step.get('depends_on', []))
+    
+    unknown = set(graph.dependencies) - set(steps)
+    if unknown:
+        print(f"✗ Steps depend on unknown steps: {', '.join(sorted(unknown))}")
+        return False, collection_name
+    
+    cycle = graph.detect_cycles()
+    if cycle:
+        print(f"✗ Dependency cycle between steps: {', '.join(cycle)}")
+        return False, collection_name
+    
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_STEPS)
+    runner = run_step if args.isolate else run_step_inproc
+    
+    async def run_bounded(step, step_args):
+        async with semaphore:
+            return await runner(step['name'], os.path.join(STEP_SCRIPTS_DIR, step['script']), step_args)
+    
+    all_success = True
+    running = {}
+    ready = graph.get_ready_tasks()
+    while ready or running:
+        for step_id in ready:
+            i, step = steps[step_id]
+            if i not in steps_to_run:
+                print(f"\n[Step {i}/{len(STEPS)}] {step['name']} - SKIPPED")
+                ready.extend(graph.mark_completed(step_id))
+                continue
+            
+            print(f"\n[Step {i}/{len(STEPS)}] {step['name']}")
+            print(f"Description: {step['description']}")
+            
+            if i == 1:  # Create Domain step
+                if collection_name:
+                    print("Skipping - using existing collection")
+                    ready.extend(graph.mark_completed(step_id))
+                    continue
+                
+                # Validate that we have matching lat/lon/radius lists
+                if not args.lat or not args.lon or not args.radius:
+                    print("✗ Missing lat/lon/radius arguments")
+                    all_success = False
+                    continue
+                
+                if len(args.lat) != len(args.lon) or len(args.lat) != len(args.radius):
+                    print("✗ Mismatched number of lat/lon/radius arguments")
+                    all_success = False
+                    continue
+                
+                step_args = ['--name', args.name]
+                
+                # Add each circle
+                for lat, lon, radius in zip(args.lat, args.lon, args.radius):
+                    step_args.extend(['--lat', str(lat), '--lon', str(lon), '--radius', str(radius)])
+            else:
+                # Other steps need the collection name
+                if not collection_name:
+                    print("✗ No collection name available. Run step 1 first or provide --collection")
+                    all_success = False
+                    continue
+                
+                step_args = ['--collection', collection_name] if step.get('supports_collection', True) else []
+            
+            running[asyncio.ensure_future(run_bounded(step, step_args))] = step_id
+        
+        ready = []
+        if not running:
+            break
+        
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            step_id = running.pop(task)
+            i, step = steps[step_id]
+            success, output, value = task.result()
+            
+            # Collection name from step 1 (returned in-process, otherwise
+            # picked out of its output)
+            if i == 1 and success and value:
+                collection_name = value
+                print(f"\n✓ Created domain collection: {collection_name}")
+            
+            results.append({
+                'step': step['name'],
+                'success': success,
+                'output': output
+            })
+            
+            if success:
+                ready.extend(graph.mark_completed(step_id))
+            else:
+                # Steps depending on this one are never started
+                all_success = False
+                print(f"\n✗ Steps depending on {step['name']} will not run")
+    
+    return all_success, collection_name
 
 def main():
     """Main orchestrator function."""
@@ -144,6 +386,10 @@ def main():
     parser.add_argument('--steps', type=str, default=None,
                        help='Comma-separated list of step numbers to run (e.g., "1,2,3")')
     
+    # Optional: run each step in its own Python process
+    parser.add_argument('--isolate', action='store_true',
+                       help='Run each step as a separate process instead of in-process')
+    
     args = parser.parse_args()
     
     print("Food Insecurity Analysis Orchestrator")
@@ -151,14 +397,8 @@ def main():
     print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"Database: {os.getenv('TEST_DB_NAME', 'food_insecurity_test')}")
     
-    # Change to scripts directory
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    step_scripts_dir = os.path.join(script_dir, 'step_scripts')
-    os.chdir(step_scripts_dir)
-    
     # Track results
     results = []
-    all_success = True
     collection_name = args.collection
     
     # Determine which steps to run
@@ -167,76 +407,13 @@ def main():
     else:
         steps_to_run = list(range(1, len(STEPS) + 1))
     
-    # Run each step
-    for i, step in enumerate(STEPS, 1):
-        if i not in steps_to_run:
-            print(f"\n[Step {i}/{len(STEPS)}] {step['name']} - SKIPPED")
-            continue
-            
-        print(f"\n[Step {i}/{len(STEPS)}] {step['name']}")
-        print(f"Description: {step['description']}")
-        
-        # Build arguments for the step
-        step_args = []
-        
-        if i == 1:  # Create Domain step
-            if collection_name:
-                print("Skipping - using existing collection")
-                continue
-            
-            # Validate that we have matching lat/lon/radius lists
-            if not args.lat or not args.lon or not args.radius:
-                print("✗ Missing lat/lon/radius arguments")
-                all_success = False
-                break
-            
-            if len(args.lat) != len(args.lon) or len(args.lat) != len(args.radius):
-                print("✗ Mismatched number of lat/lon/radius arguments")
-                all_success = False
-                break
-            
-            step_args = ['--name', args.name]
-            
-            # Add each circle
-            for lat, lon, radius in zip(args.lat, args.lon, args.radius):
-                step_args.extend(['--lat', str(lat), '--lon', str(lon), '--radius', str(radius)])
-        else:
-            # Other steps need the collection name
-            if not collection_name:
-                print("✗ No collection name available. Run step 1 first or provide --collection")
-                all_success = False
-                break
-            
-            if step.get('supports_collection', True):
-                step_args = ['--collection', collection_name]
-        
-        success, output = run_step(step['name'], step['script'], step_args)
-        
-        # Extract collection name from step 1 output
-        if i == 1 and success:
-            # The output already contains both stdout and stderr
-            extracted_name = extract_collection_name(output)
-            if not extracted_name:
-                # Try a simpler pattern match for d_* collection names
-                import re
-                match = re.search(r'd_[a-zA-Z0-9_]+', output)
-                if match:
-                    extracted_name = match.group(0)
-            
-            if extracted_name:
-                collection_name = extracted_name
-                print(f"\n✓ Created domain collection: {collection_name}")
-        
-        results.append({
-            'step': step['name'],
-            'success': success,
-            'output': output
-        })
-        
-        if not success:
-            all_success = False
-            print(f"\n✗ Stopping orchestration due to failure in step: {step['name']}")
-            break
+    try:
+        all_success, collection_name = asyncio.run(
+            run_steps(args, steps_to_run, collection_name, results)
+        )
+    finally:
+        if _shared_client is not None:
+            _shared_client.close()
     
     # Print summary
     print(f"\n{'='*60}")
@@ -7,11 +7,13 @@ Creates a new collection with prefix 'd_' containing copies of census blocks.
 import os
 import sys
 import logging
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, ASCENDING, GEOSPHERE
 from dotenv import load_dotenv
 import argparse
-from datetime import datetime
+from datetime import datetime, timezone
 import re
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -29,26 +31,75 @@ load_dotenv()
 MONGO_URI = os.getenv('MONGO_DB_URI', 'mongodb://localhost:27017/')
 DB_NAME = os.getenv('TEST_DB_NAME', 'food_insecurity_test')
 
+# Client settings for the bulk copy: acknowledged but unjournaled writes,
+# and wire compression with whichever compressors are installed (zlib is
+# built in)
+MONGO_CLIENT_OPTIONS = {
+    'w': 1,
+    'journal': False,
+    'maxPoolSize': 64,
+    'socketTimeoutMS': 120000,
+    'compressors': ','.join(
+        [name for name, module in (('zstd', 'zstandard'), ('snappy', 'snappy'))
+         if importlib.util.find_spec(module) is not None] + ['zlib']
+    )
+}
+
+mongo_client = MongoClient(MONGO_URI, **MONGO_CLIENT_OPTIONS)
+
+# Maximum number of circles copied at once
+MAX_CIRCLE_WORKERS = min(8, os.cpu_count() or 1)
+
+# Runs of spaces, special characters and underscores, used to sanitize
+# domain names
+NAME_SEPARATORS = re.compile(r'[^a-zA-Z0-9]+')
+
 def sanitize_domain_name(name):
     """Sanitize domain name for MongoDB collection naming."""
-    # Replace spaces and special characters with underscores
-    sanitized = re.sub(r'[^a-zA-Z0-9_]', '_', name.lower())
-    # Remove consecutive underscores
-    sanitized = re.sub(r'_+', '_', sanitized)
+    # Replace spaces and special characters with single underscores
+    sanitized = NAME_SEPARATORS.sub('_', name.lower())
     # Remove leading/trailing underscores
     sanitized = sanitized.strip('_')
     return sanitized
 
-def create_domain(domain_name, circles):
+def copy_circle_blocks(source_collection, collection_name, lat, lon, radius, domain_metadata):
+    """
+    Copy the census blocks within one circle into ``collection_name`` on the
+    server, skipping blocks another circle already copied.
+    """
+    radius_meters = radius * 1609.34
+    
+    source_collection.aggregate([
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [lon, lat]},
+            "distanceField": "domain_distance",
+            "maxDistance": radius_meters,
+            "spherical": True,
+            "query": {"properties.geoid": {"$nin": [None, ""]}}
+        }},
+        {"$addFields": {"domain_metadata": {"$literal": domain_metadata}}},
+        {"$project": {"_id": 0, "domain_distance": 0}},
+        # Use geoid to avoid duplicates where circles overlap
+        {"$merge": {
+            "into": collection_name,
+            "on": "properties.geoid",
+            "whenMatched": "keepExisting",
+            "whenNotMatched": "insert"
+        }}
+    ], allowDiskUse=True)
+
+def create_domain(domain_name, circles, client=None):
     """
     Create a domain collection by copying census blocks within multiple circles.
     
     Args:
         domain_name: Name for the domain (will be prefixed with 'd_')
         circles: List of tuples (lat, lon, radius_miles)
+        client: Optional MongoClient to use instead of this module's client
     """
     # Connect to MongoDB
-    client = MongoClient(MONGO_URI)
+    if client is None:
+        client = mongo_client
     db = client[DB_NAME]
     
     # Sanitize and create collection name
@@ -60,103 +111,83 @@ def create_domain(domain_name, circles):
     for i, (lat, lon, radius) in enumerate(circles):
         logging.info(f"Circle {i+1}: Center ({lat}, {lon}), Radius {radius} miles")
     
-    # Check if domain already exists
-    if collection_name in db.list_collection_names():
-        logging.warning(f"Domain collection {collection_name} already exists. Dropping and recreating...")
-        db[collection_name].drop()
+    # Drop any existing domain with this name (a no-op if there is none)
+    db.drop_collection(collection_name)
     
     # Get source collection
     source_collection = db['census_blocks']
     
-    # Find blocks within any of the circles
-    all_blocks = {}  # Use dict to avoid duplicates
-    
-    for lat, lon, radius in circles:
-        radius_meters = radius * 1609.34
-        
-        blocks_cursor = source_collection.find({
-            "geometry": {
-                "$nearSphere": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": [lon, lat]
-                    },
-                    "$maxDistance": radius_meters
-                }
-            }
-        })
-        
-        # Add blocks to our collection (using geoid as key to avoid duplicates)
-        for block in blocks_cursor:
-            geoid = block.get('properties', {}).get('geoid')
-            if geoid:
-                all_blocks[geoid] = block
-    
-    # Copy blocks to domain collection
+    # Copy blocks within any of the circles on the server; each circle's
+    # pipeline $merges into the domain collection, keyed on a unique geoid
     domain_collection = db[collection_name]
-    blocks_copied = 0
-    total_population = 0
-    
-    blocks_list = list(all_blocks.values())
+    domain_collection.create_index("properties.geoid", unique=True)
+    created_at = datetime.now(timezone.utc)
+    domain_metadata = {
+        'domain_name': domain_name,
+        'circles': [{'lat': lat, 'lon': lon, 'radius_miles': radius} for lat, lon, radius in circles],
+        'added_at': created_at
+    }
+    with ThreadPoolExecutor(max_workers=min(len(circles), MAX_CIRCLE_WORKERS)) as executor:
+        futures = [
+            executor.submit(copy_circle_blocks, source_collection, collection_name, lat, lon, radius, domain_metadata)
+            for lat, lon, radius in circles
+        ]
+        for future in futures:
+            future.result()
     
-    if not blocks_list:
+    if domain_collection.find_one({}, {'_id': 1}) is None:
         logging.error("No blocks found within the specified radius!")
+        domain_collection.drop()
         return None
     
-    # Insert blocks in batches
-    batch_size = 1000
-    for i in range(0, len(blocks_list), batch_size):
-        batch = blocks_list[i:i+batch_size]
-        
-        # Add domain metadata to each block
-        for block in batch:
-            block['domain_metadata'] = {
-                'domain_name': domain_name,
-                'circles': [{'lat': lat, 'lon': lon, 'radius_miles': radius} for lat, lon, radius in circles],
-                'added_at': datetime.utcnow()
-            }
-            # Remove _id to avoid conflicts
-            if '_id' in block:
-                del block['_id']
-            
-            # Track statistics
-            total_population += block.get('properties', {}).get('pop', 0)
-        
-        domain_collection.insert_many(batch)
-        blocks_copied += len(batch)
-        logging.info(f"  Copied {blocks_copied} blocks so far...")
-    
     # Create indexes
     logging.info("Creating indexes...")
-    domain_collection.create_index("properties.geoid")
-    domain_collection.create_index([("geometry", "2dsphere")])
-    domain_collection.create_index("properties.pop")
-    domain_collection.create_index("properties.poverty_rate")
-    domain_collection.create_index("properties.snap_rate")
-    domain_collection.create_index("properties.vehicle_access_rate")
-    domain_collection.create_index("properties.block_group_geoid")
-    
-    # Calculate domain statistics
+    domain_collection.create_indexes([
+        IndexModel([("geometry", GEOSPHERE)]),
+        IndexModel([("properties.pop", ASCENDING)]),
+        IndexModel([("properties.poverty_rate", ASCENDING)]),
+        IndexModel([("properties.snap_rate", ASCENDING)]),
+        IndexModel([("properties.vehicle_access_rate", ASCENDING)]),
+        IndexModel([("properties.block_group_geoid", ASCENDING)])
+    ])
+    
+    # Calculate domain totals, statistics and score statistics in one pass
+    facets = next(domain_collection.aggregate([
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "blocks": {"$sum": 1},
+                "population": {"$sum": "$properties.pop"}
+            }}],
+            "poverty": [{"$match": {"properties.poverty_rate": {"$gt": 0}}}, {"$count": "n"}],
+            "snap": [{"$match": {"properties.snap_rate": {"$gt": 0}}}, {"$count": "n"}],
+            "scores": [{"$match": {"properties.food_insecurity_score": {"$gte": 0}}}, {"$count": "n"}],
+            "score_stats": [
+                {"$match": {"properties.food_insecurity_score": {"$gt": 0}}},
+                {"$group": {
+                    "_id": None,
+                    "avg_score": {"$avg": "$properties.food_insecurity_score"},
+                    "min_score": {"$min": "$properties.food_insecurity_score"},
+                    "max_score": {"$max": "$properties.food_insecurity_score"},
+                    "total_need": {"$sum": "$properties.need"}
+                }}
+            ]
+        }}
+    ]))
+    
+    blocks_copied = facets['totals'][0]['blocks']
+    total_population = facets['totals'][0]['population']
+    logging.info(f"  Copied {blocks_copied} blocks")
+    
     stats = {
         'total_blocks': blocks_copied,
         'total_population': total_population,
-        'blocks_with_poverty_data': domain_collection.count_documents({"properties.poverty_rate": {"$gt": 0}}),
-        'blocks_with_snap_data': domain_collection.count_documents({"properties.snap_rate": {"$gt": 0}}),
-        'blocks_with_scores': domain_collection.count_documents({"properties.food_insecurity_score": {"$gte": 0}})
+        'blocks_with_poverty_data': facets['poverty'][0]['n'] if facets['poverty'] else 0,
+        'blocks_with_snap_data': facets['snap'][0]['n'] if facets['snap'] else 0,
+        'blocks_with_scores': facets['scores'][0]['n'] if facets['scores'] else 0
     }
     
-    # Calculate score statistics for the domain
-    score_stats = list(domain_collection.aggregate([
-        {"$match": {"properties.food_insecurity_score": {"$gt": 0}}},
-        {"$group": {
-            "_id": None,
-            "avg_score": {"$avg": "$properties.food_insecurity_score"},
-            "min_score": {"$min": "$properties.food_insecurity_score"},
-            "max_score": {"$max": "$properties.food_insecurity_score"},
-            "total_need": {"$sum": "$properties.need"}
-        }}
-    ]))
-    
+    score_stats = facets['score_stats']
     if score_stats:
         stats.update({
             'avg_food_insecurity_score': score_stats[0]['avg_score'],
@@ -183,7 +214,7 @@ def create_domain(domain_name, circles):
                 'circles': [{'lat': lat, 'lon': lon, 'radius_miles': radius} for lat, lon, radius in circles],
                 'center': {'coordinates': [avg_lon, avg_lat]},
                 'radius_miles': avg_radius,  # Keep for backward compatibility
-                'created_at': datetime.utcnow(),
+                'created_at': created_at,
                 'stats': stats
             }
         },
@@ -209,8 +240,17 @@ def create_domain(domain_name, circles):
     
     return collection_name
 
-def main():
-    """Main function with argument parsing."""
+def main(argv=None, client=None):
+    """
+    Main function with argument parsing.
+    
+    Args:
+        argv: Arguments to parse (defaults to the command line)
+        client: Optional MongoClient to reuse, e.g. when run by the orchestrator
+        
+    Returns:
+        Name of the created collection, or None
+    """
     parser = argparse.ArgumentParser(description='Create a domain collection from census blocks')
     parser.add_argument('--name', type=str, default='downtown_la',
                        help='Name for the domain (will be prefixed with d_)')
@@ -221,7 +261,7 @@ def main():
     parser.add_argument('--radius', type=float, action='append',
                        help='Radius in miles (can be specified multiple times)')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Validate arguments
     if not args.lat or not args.lon or not args.radius:
@@ -235,13 +275,16 @@ def main():
     # Create domain
     collection_name = create_domain(
         domain_name=args.name,
-        circles=circles
+        circles=circles,
+        client=client
     )
     
     if collection_name:
         print(f"\nDomain collection '{collection_name}' created successfully!")
         print(f"You can now run subsequent steps using:")
         print(f"  --collection {collection_name}")
+    
+    return collection_name
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
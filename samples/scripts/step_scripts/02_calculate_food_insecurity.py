@@ -7,7 +7,7 @@ Uses existing poverty and SNAP rates to calculate initial scores.
 import os
 import sys
 import logging
-from pymongo import MongoClient, UpdateOne
+from pymongo import MongoClient, UpdateOne, IndexModel, ASCENDING
 from dotenv import load_dotenv
 import argparse
 from datetime import datetime
@@ -65,15 +65,17 @@ def calculate_need(population, food_insecurity_score):
     """Calculate need metric (population × score)."""
     return population * food_insecurity_score
 
-def process_domain_collection(collection_name):
+def process_domain_collection(collection_name, client=None):
     """
     Process blocks in a domain collection to calculate food insecurity scores.
     
     Args:
         collection_name: Name of the domain collection
+        client: Optional MongoClient to reuse (one is created if omitted)
     """
     # Connect to MongoDB
-    client = MongoClient(MONGO_URI)
+    if client is None:
+        client = MongoClient(MONGO_URI)
     db = client[DB_NAME]
     
     # Check if collection exists
@@ -86,7 +88,7 @@ def process_domain_collection(collection_name):
     logging.info(f"Processing collection: {collection_name}")
     
     # Get all blocks
-    total_blocks = collection.count_documents({})
+    total_blocks = collection.estimated_document_count()
     logging.info(f"Total blocks to process: {total_blocks:,}")
     
     # Process in batches
@@ -187,8 +189,10 @@ def process_domain_collection(collection_name):
     
     # Create indexes for the new fields
     logging.info("Creating indexes...")
-    collection.create_index("properties.food_insecurity_score")
-    collection.create_index("properties.need")
+    collection.create_indexes([
+        IndexModel([("properties.food_insecurity_score", ASCENDING)]),
+        IndexModel([("properties.need", ASCENDING)])
+    ])
     
     logging.info("=" * 60)
     logging.info("FOOD INSECURITY CALCULATION COMPLETE")
@@ -203,16 +207,22 @@ def process_domain_collection(collection_name):
     
     return True
 
-def main():
-    """Main function with argument parsing."""
+def main(argv=None, client=None):
+    """
+    Main function with argument parsing.
+    
+    Args:
+        argv: Arguments to parse (defaults to the command line)
+        client: Optional MongoClient to reuse, e.g. when run by the orchestrator
+    """
     parser = argparse.ArgumentParser(description='Calculate food insecurity scores for domain blocks')
     parser.add_argument('--collection', type=str, required=True,
                        help='Domain collection name')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Process the collection
-    success = process_domain_collection(args.collection)
+    success = process_domain_collection(args.collection, client=client)
     
     if success:
         print(f"\n✓ Food insecurity scores calculated successfully!")
@@ -10,7 +10,7 @@ import logging
 import requests
 import pandas as pd
 import numpy as np
-from pymongo import MongoClient, UpdateOne
+from pymongo import MongoClient, UpdateOne, IndexModel, ASCENDING
 from dotenv import load_dotenv
 import argparse
 from datetime import datetime
@@ -155,7 +155,7 @@ def distribute_vehicle_access_to_blocks(collection, vehicle_access_df):
     logging.info(f"Created lookup for {len(vehicle_lookup)} block groups")
     
     # Process all blocks in the collection
-    total_blocks = collection.count_documents({})
+    total_blocks = collection.estimated_document_count()
     logging.info(f"Processing {total_blocks:,} blocks")
     
     updates = []
@@ -214,8 +214,10 @@ def distribute_vehicle_access_to_blocks(collection, vehicle_access_df):
     
     # Create indexes for new fields
     logging.info("Creating indexes for vehicle access fields...")
-    collection.create_index("properties.vehicle_access_rate")
-    collection.create_index("properties.block_group_geoid")
+    collection.create_indexes([
+        IndexModel([("properties.vehicle_access_rate", ASCENDING)]),
+        IndexModel([("properties.block_group_geoid", ASCENDING)])
+    ])
     
     # Calculate and log statistics
     coverage_pct = (blocks_with_vehicle_data / blocks_processed) * 100 if blocks_processed > 0 else 0
@@ -232,15 +234,17 @@ def distribute_vehicle_access_to_blocks(collection, vehicle_access_df):
         'coverage_percentage': coverage_pct
     }
 
-def process_domain_collection(collection_name):
+def process_domain_collection(collection_name, client=None):
     """
     Process a domain collection to add vehicle access data.
     
     Args:
         collection_name: Name of the domain collection
+        client: Optional MongoClient to reuse (one is created if omitted)
     """
     # Connect to MongoDB
-    client = MongoClient(MONGO_URI)
+    if client is None:
+        client = MongoClient(MONGO_URI)
     db = client[DB_NAME]
     
     # Check if collection exists
@@ -280,16 +284,22 @@ def process_domain_collection(collection_name):
     logging.info(f"✓ Vehicle access data added to {collection_name}")
     return True
 
-def main():
-    """Main function with argument parsing."""
+def main(argv=None, client=None):
+    """
+    Main function with argument parsing.
+    
+    Args:
+        argv: Arguments to parse (defaults to the command line)
+        client: Optional MongoClient to reuse, e.g. when run by the orchestrator
+    """
     parser = argparse.ArgumentParser(description='Add vehicle access data to domain collection')
     parser.add_argument('--collection', type=str, required=True,
                        help='Domain collection name')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Process the collection
-    success = process_domain_collection(args.collection)
+    success = process_domain_collection(args.collection, client=client)
     
     if success:
         print(f"\n✓ Vehicle access data added successfully!")
@@ -24,6 +24,7 @@ load_dotenv()
 # Configuration
 MONGO_URI = os.getenv('MONGO_DB_URI', 'mongodb://localhost:27017/')
 DB_NAME = os.getenv('TEST_DB_NAME', 'food_insecurity_test')
+client = MongoClient(MONGO_URI)
 
 def calculate_improved_food_insecurity_score(poverty_rate, snap_rate, vehicle_access_rate, population):
     """
@@ -88,13 +89,12 @@ def calculate_improved_food_insecurity_score(poverty_rate, snap_rate, vehicle_ac
 
 def update_scores_for_collection(collection_name):
     """Update scores for all blocks in a collection."""
-    client = MongoClient(MONGO_URI)
     db = client[DB_NAME]
     collection = db[collection_name]
     
     logging.info(f"Updating scores for collection: {collection_name}")
     
-    total_blocks = collection.count_documents({})
+    total_blocks = collection.estimated_document_count()
     logging.info(f"Total blocks to process: {total_blocks:,}")
     
     if total_blocks == 0:
@@ -223,7 +223,6 @@ def main():
     logging.info("=" * 60)
     
     try:
-        client = MongoClient(MONGO_URI)
         db = client[DB_NAME]
         
         # Get all collections to update
@@ -243,7 +242,7 @@ def main():
         
         logging.info(f"Found {len(collections_to_update)} collections to update:")
         for collection_name in collections_to_update:
-            count = db[collection_name].count_documents({})
+            count = db[collection_name].estimated_document_count()
             logging.info(f"  {collection_name}: {count:,} blocks")
         
         # Update each collection
@@ -21,6 +21,7 @@ load_dotenv()
 # Configuration
 MONGO_URI = os.getenv('MONGO_DB_URI', 'mongodb://localhost:27017/')
 DB_NAME = os.getenv('TEST_DB_NAME', 'food_insecurity_test')
+client = MongoClient(MONGO_URI)
 
 def calculate_new_food_insecurity_score(poverty_rate, snap_rate, population):
     """
@@ -66,7 +67,6 @@ def calculate_new_food_insecurity_score(poverty_rate, snap_rate, population):
 def update_collection_scores(collection_name):
     """Update food insecurity scores for a specific collection."""
     
-    client = MongoClient(MONGO_URI)
     db = client[DB_NAME]
     collection = db[collection_name]
     
@@ -159,7 +159,6 @@ def main():
     start_time = datetime.now()
     
     # Connect to database
-    client = MongoClient(MONGO_URI)
     db = client[DB_NAME]
     
     # Update only census_blocks collection